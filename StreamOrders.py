@@ -1,57 +1,470 @@
+import calendar
 import csv
+import io
+import mmap
 import os
 import sys
-from typing import Dict, Any
-from dotenv import load_dotenv
+import time
+from functools import partial
+from multiprocessing import Pool
+from queue import Queue
+from threading import Thread
+from typing import BinaryIO, Dict, Any, Iterator, List, Optional, Tuple
 import redis
+from _config import make_pool
 
+# Number of XADD commands sent per pipeline round-trip
+BATCH_SIZE = 1000
 
-def create_redis_connection() -> redis.Redis:
+# Read buffer for the CSV file; larger buffers stop paying off well before 16 MiB
+READ_BUFFER_SIZE = 1 << 20
+
+# Maximum number of parsed batches waiting for the writer
+QUEUE_SIZE = 8
+
+# Set VERBOSE=1 to report every batch; otherwise progress goes to stderr every PROGRESS_INTERVAL records
+VERBOSE = os.getenv('VERBOSE') == '1'
+PROGRESS_INTERVAL = 10_000
+
+
+def connect_to_redis(health_check_interval: int = 0) -> redis.Redis:
     """
-    Create and return a Redis connection using environment variables.
+    Create, ping and return a Redis connection using the settings in _config.
+    
+    Unlike create_redis_connection this raises on failure, so it is safe to
+    call from worker processes.
+    
+    Args:
+        health_check_interval: Seconds between connection health checks; 0 disables
+            them, which suits this short-lived ingest
+    
+    Returns:
+        redis.Redis: Redis client instance
+        
+    Raises:
+        ValueError: If the connection settings are incomplete
+        ConnectionError: If the server cannot be reached
+    """
+    # Create Redis connection backed by a bounded pool of reusable connections
+    redis_client = redis.Redis(connection_pool=make_pool(health_check_interval))
+    
+    # Test the connection
+    if not redis_client.ping():
+        raise ConnectionError("Failed to ping Redis server")
+        
+    return redis_client
+
+
+def create_redis_connection(health_check_interval: int = 0) -> redis.Redis:
+    """
+    Create and return a Redis connection, exiting the script if it cannot be made.
+    
+    Args:
+        health_check_interval: Seconds between connection health checks; 0 disables them
     
     Returns:
         redis.Redis: Redis client instance
     """
     try:
-        # Load environment variables from .env file
-        load_dotenv()
+        return connect_to_redis(health_check_interval)
+    except Exception as e:
+        print(f"❌ Error connecting to Redis: {e}", file=sys.stderr)
+        sys.exit(1)
+
+
+def queue_rows(
+    pipe: redis.client.Pipeline,
+    stream_name: str,
+    headers: Tuple[str, ...],
+    payload: Dict[str, str],
+    batch: List[Tuple[str, List[str]]],
+    stream_maxlen: Optional[int],
+    first_row: int,
+) -> int:
+    """
+    Queue one XADD per (entry ID, row) pair on the pipeline, skipping rows that fail.
+    
+    Args:
+        pipe: Pipeline to queue the XADD commands on
+        stream_name: Name of the Redis stream
+        headers: CSV header
+        payload: Dict refilled for every row; safe because XADD copies the fields
+            into its command as soon as it is queued
+        batch: (entry ID, row) pairs to add
+        stream_maxlen: Approximate stream length cap, or None for no cap
+        first_row: Number of the batch's first row, used in error messages
+        
+    Returns:
+        int: Number of XADD commands queued
+    """
+    batch_count = 0
+    for entry_id, row in batch:
+        try:
+            # csv.reader already yields strings, so map them straight onto the header;
+            # ragged rows get a dict of their own so no stale values leak in
+            if len(row) == len(headers):
+                payload.update(zip(headers, row))
+                processed_row = payload
+            else:
+                processed_row = dict(zip(headers, row))
+            
+            # Queue the entry on the pipeline
+            pipe.xadd(stream_name, processed_row, id=entry_id, maxlen=stream_maxlen, approximate=True)
+            batch_count += 1
+        except Exception as e:
+            print(f"⚠️ Error processing row {first_row + batch_count}: {e}", file=sys.stderr)
+    return batch_count
+
+
+def flush_pipeline(pipe: redis.client.Pipeline, batch_count: int) -> int:
+    """
+    Execute the queued pipeline commands and report any failed entries.
+    
+    Args:
+        pipe: Pipeline holding the queued XADD commands
+        batch_count: Number of commands queued on the pipeline
         
-        # Get Redis connection details from environment variables
-        redis_host = os.getenv('REDIS_HOST')
-        redis_port = int(os.getenv('REDIS_PORT', '19536'))
-        redis_username = os.getenv('REDIS_USERNAME', 'default')
-        redis_password = os.getenv('REDIS_PASSWORD')
+    Returns:
+        int: Number of entries successfully added to the stream
+    """
+    try:
+        results = pipe.execute(raise_on_error=False)
+    except redis.exceptions.RedisError as e:
+        print(f"⚠️ Error flushing batch of {batch_count} records: {e}", file=sys.stderr)
+        return 0
+    
+    # Anything queued after the XADDs (e.g. an XTRIM) is reported but not counted
+    added, extra = results[:batch_count], results[batch_count:]
+    for r in extra:
+        if isinstance(r, Exception):
+            print(f"⚠️ Error trimming stream: {r}", file=sys.stderr)
+    
+    failed = [r for r in added if isinstance(r, Exception)]
+    if failed:
+        print(f"⚠️ {len(failed)} of {batch_count} records failed in batch: {failed[0]}", file=sys.stderr)
+    return len(added) - len(failed)
+
+
+def invoice_timestamp_ms(invoice_date_str: str) -> int:
+    """
+    Convert an InvoiceDate string such as '12/1/2010 8:26' to milliseconds since the epoch (UTC).
+    
+    Args:
+        invoice_date_str: Invoice date in 'M/D/YYYY H:MM' format
         
-        if not all([redis_host, redis_password]):
-            raise ValueError("Missing required Redis connection parameters in .env file")
+    Returns:
+        int: Timestamp in milliseconds
         
-        # Create Redis connection
-        redis_client = redis.Redis(
-            host=redis_host,
-            port=redis_port,
-            username=redis_username,
-            password=redis_password,
-            decode_responses=True,
-            socket_connect_timeout=5,
-            health_check_interval=30,
-        )
+    Raises:
+        ValueError: If the string is not in the expected format
+    """
+    date_part, _, time_part = invoice_date_str.partition(' ')
+    month, day, year = date_part.split('/')
+    hour, minute = time_part.split(':')
+    return calendar.timegm((int(year), int(month), int(day), int(hour), int(minute), 0)) * 1000
+
+
+def read_batches(
+    csv_reader: Iterator[List[str]],
+    headers: Tuple[str, ...],
+    batches: "Queue[Optional[Tuple[int, List[Tuple[str, List[str]]]]]]",
+    errors: List[Exception],
+    event_time_ids: bool = False,
+) -> None:
+    """
+    Parse the CSV rows and put batches of (entry ID, row) pairs on the queue.
+    
+    Runs on the reader thread. Each batch is queued with the newest event time
+    (ms) it contains, or 0 when Redis assigns the IDs. A None sentinel is always
+    queued last so the writer knows to stop; any parse error is recorded in ``errors``.
+    
+    Args:
+        csv_reader: csv.reader positioned after the header row
+        headers: CSV header
+        batches: Bounded queue the batches are handed over on
+        errors: List collecting any exception raised while reading
+        event_time_ids: Derive entry IDs ('<ms>-*') from InvoiceDate instead of letting Redis assign them
+    """
+    try:
+        date_index = headers.index('InvoiceDate') if event_time_ids and 'InvoiceDate' in headers else None
+        last_ms = 0
+        batch = []
         
-        # Test the connection
-        if not redis_client.ping():
-            raise ConnectionError("Failed to ping Redis server")
+        for row in csv_reader:
+            # Skip blank lines, as DictReader did
+            if not row:
+                continue
+            
+            entry_id = '*'
+            if date_index is not None:
+                try:
+                    # Never go backwards: stream IDs must keep increasing
+                    last_ms = max(last_ms, invoice_timestamp_ms(row[date_index]))
+                except (ValueError, IndexError):
+                    # A '*' ID would jump to wall-clock time and reject every later
+                    # event-time ID, so reuse the last event time instead
+                    if not last_ms:
+                        print(f"⚠️ Skipping row with unparseable InvoiceDate: {row}", file=sys.stderr)
+                        continue
+                entry_id = f"{last_ms}-*"
             
-        return redis_client
+            batch.append((entry_id, row))
+            
+            if len(batch) >= BATCH_SIZE:
+                batches.put((last_ms, batch))
+                batch = []
         
+        if batch:
+            batches.put((last_ms, batch))
+            
     except Exception as e:
-        print(f"❌ Error connecting to Redis: {e}", file=sys.stderr)
-        sys.exit(1)
+        errors.append(e)
+    finally:
+        batches.put(None)
+
+
+def report_progress(previous_total: int, total_processed: int) -> None:
+    """
+    Report ingest progress: every batch with VERBOSE=1, otherwise every PROGRESS_INTERVAL records on stderr.
+    
+    Args:
+        previous_total: Records processed before the latest batch
+        total_processed: Records processed so far
+    """
+    if VERBOSE:
+        print(f"Processed {total_processed} records...")
+    elif total_processed // PROGRESS_INTERVAL > previous_total // PROGRESS_INTERVAL:
+        sys.stderr.write(f"Processed {total_processed} records...\n")
+        sys.stderr.flush()
+
+
+def stream_with_reader_thread(
+    redis_client: redis.Redis,
+    csv_file: str,
+    stream_name: str,
+    stream_maxlen: Optional[int],
+    event_time_ids: bool,
+    retention_ms: int,
+) -> int:
+    """
+    Stream the CSV on this process, parsing on a reader thread while this thread pipelines the XADDs.
+    
+    Args:
+        redis_client: Redis client instance
+        csv_file: Path to the CSV file containing order data
+        stream_name: Name of the Redis stream
+        stream_maxlen: Approximate stream length cap, or None for no cap
+        event_time_ids: Derive entry IDs from InvoiceDate
+        retention_ms: Retention window for XTRIM MINID ~, or 0 to disable it
+        
+    Returns:
+        int: Number of records added to the stream
+    """
+    raw = open(csv_file, 'rb', buffering=READ_BUFFER_SIZE)
+    with io.TextIOWrapper(raw, encoding='utf-8-sig', newline='') as csvf:
+        csv_reader = csv.reader(csvf)
+        headers = tuple(next(csv_reader, ()))
+        batches: "Queue[Optional[Tuple[int, List[Tuple[str, List[str]]]]]]" = Queue(maxsize=QUEUE_SIZE)
+        read_errors: List[Exception] = []
+        reader = Thread(
+            target=read_batches,
+            args=(csv_reader, headers, batches, read_errors, event_time_ids),
+            daemon=True,
+        )
+        reader.start()
+        total_processed = 0
+        
+        # One payload dict is refilled for every row (see queue_rows)
+        payload = dict.fromkeys(headers, '')
+        
+        # Pipeline XADDs so each batch costs a single round-trip
+        pipe = redis_client.pipeline(transaction=False)
+        
+        while True:
+            item = batches.get()
+            if item is None:
+                break
+            newest_ms, batch = item
+            
+            batch_count = queue_rows(
+                pipe, stream_name, headers, payload, batch, stream_maxlen, total_processed + 1
+            )
+            
+            # Trim entries outside the retention window, relative to the newest event time
+            # (or the wall clock when Redis assigns the IDs)
+            if retention_ms:
+                cutoff_ms = (newest_ms or int(time.time() * 1000)) - retention_ms
+                pipe.xtrim(stream_name, minid=cutoff_ms, approximate=True)
+            
+            previous_total = total_processed
+            total_processed += flush_pipeline(pipe, batch_count)
+            report_progress(previous_total, total_processed)
+        
+        reader.join()
+        if read_errors:
+            raise read_errors[0]
+    
+    return total_processed
+
+
+def split_csv(csv_file: str, workers: int) -> Tuple[List[str], List[Tuple[int, int]]]:
+    """
+    Read the CSV header and split the remaining rows into newline-aligned byte ranges.
+    
+    Assumes no quoted field contains a newline, which holds for OnlineRetail.csv.
+    
+    Args:
+        csv_file: Path to the CSV file containing order data
+        workers: Number of ranges to aim for
+        
+    Returns:
+        Tuple[List[str], List[Tuple[int, int]]]: The header and the (start, end) byte range of each chunk
+    """
+    with open(csv_file, 'rb') as raw:
+        header_line = raw.readline()
+        headers = next(csv.reader([header_line.decode('utf-8-sig')]), [])
+        data_start = len(header_line)
+        size = os.fstat(raw.fileno()).st_size
+        if size <= data_start:
+            return headers, []
+        
+        with mmap.mmap(raw.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            offsets = [data_start]
+            for i in range(1, workers):
+                # Move each split point forward to the start of the next line
+                newline = mm.find(b'\n', data_start + (size - data_start) * i // workers)
+                if newline == -1:
+                    break
+                if newline + 1 > offsets[-1]:
+                    offsets.append(newline + 1)
+            offsets.append(size)
+    
+    chunks = [(start, end) for start, end in zip(offsets, offsets[1:]) if start < end]
+    return headers, chunks
+
+
+def iter_lines(raw: BinaryIO, end: int) -> Iterator[str]:
+    """
+    Yield decoded lines from the current position of a binary file up to a byte offset.
+    
+    Args:
+        raw: Binary file positioned at the start of a line
+        end: Offset to stop at; must fall on a line boundary
+    """
+    position = raw.tell()
+    while position < end:
+        line = raw.readline()
+        if not line:
+            break
+        position += len(line)
+        yield line.decode('utf-8')
+
+
+def stream_chunk(
+    chunk: Tuple[int, int],
+    csv_file: str,
+    stream_name: str,
+    headers: List[str],
+    stream_maxlen: Optional[int],
+) -> int:
+    """
+    Stream one byte range of the CSV to Redis; runs in a worker process with its own connection.
+    
+    Args:
+        chunk: (start, end) byte range of the rows to stream
+        csv_file: Path to the CSV file containing order data
+        stream_name: Name of the Redis stream
+        headers: CSV header, passed in from the parent process
+        stream_maxlen: Approximate stream length cap, or None for no cap
+        
+    Returns:
+        int: Number of records added to the stream
+    """
+    redis_client = connect_to_redis(health_check_interval=0)
+    start, end = chunk
+    try:
+        headers = tuple(headers)
+        total_processed = 0
+        batch = []
+        pipe = redis_client.pipeline(transaction=False)
+        
+        # One payload dict is refilled for every row (see queue_rows)
+        payload = dict.fromkeys(headers, '')
+        
+        with open(csv_file, 'rb', buffering=READ_BUFFER_SIZE) as raw:
+            raw.seek(start)
+            for row in csv.reader(iter_lines(raw, end)):
+                # Skip blank lines, as DictReader did
+                if not row:
+                    continue
+                
+                batch.append(('*', row))
+                if len(batch) >= BATCH_SIZE:
+                    batch_count = queue_rows(
+                        pipe, stream_name, headers, payload, batch, stream_maxlen, total_processed + 1
+                    )
+                    total_processed += flush_pipeline(pipe, batch_count)
+                    batch = []
+            
+            if batch:
+                batch_count = queue_rows(
+                    pipe, stream_name, headers, payload, batch, stream_maxlen, total_processed + 1
+                )
+                total_processed += flush_pipeline(pipe, batch_count)
+        
+        return total_processed
+    finally:
+        redis_client.close()
+        redis_client.connection_pool.disconnect()
+
+
+def stream_in_parallel(
+    csv_file: str,
+    stream_name: str,
+    workers: int,
+    stream_maxlen: Optional[int],
+) -> int:
+    """
+    Stream the CSV with a pool of worker processes, one newline-aligned byte range each.
+    
+    Entries from different chunks interleave, so the stream is not in CSV order.
+    
+    Args:
+        csv_file: Path to the CSV file containing order data
+        stream_name: Name of the Redis stream
+        workers: Number of worker processes
+        stream_maxlen: Approximate stream length cap, or None for no cap
+        
+    Returns:
+        int: Number of records added to the stream
+    """
+    headers, chunks = split_csv(csv_file, workers)
+    total_processed = 0
+    
+    worker = partial(
+        stream_chunk,
+        csv_file=csv_file,
+        stream_name=stream_name,
+        headers=headers,
+        stream_maxlen=stream_maxlen,
+    )
+    
+    with Pool(min(workers, len(chunks)) or 1) as pool:
+        for processed in pool.imap_unordered(worker, chunks):
+            previous_total = total_processed
+            total_processed += processed
+            report_progress(previous_total, total_processed)
+    
+    return total_processed
 
 
 def stream_orders(csv_file: str, stream_name: str) -> None:
     """
     Read orders from a CSV file and stream them to Redis.
     
+    By default parsing runs on a reader thread while this thread pipelines the
+    XADDs; with STREAM_WORKERS > 1 the file is split across worker processes.
+    
     Args:
         csv_file: Path to the CSV file containing order data
         stream_name: Name of the Redis stream
@@ -59,31 +472,34 @@ def stream_orders(csv_file: str, stream_name: str) -> None:
     redis_client = None
     try:
         # Create Redis connection
-        redis_client = create_redis_connection()
+        redis_client = create_redis_connection(health_check_interval=0)
         print(f"✅ Successfully connected to Redis. Starting to stream data to '{stream_name}'...")
         
+        # Cap the stream length (approximate trimming); 0 disables the cap
+        stream_maxlen = int(os.getenv('STREAM_MAXLEN', '1000000')) or None
+        
+        # Opt-in: IDs from InvoiceDate (Redis 7+, and the stream must not already hold newer entries)
+        event_time_ids = os.getenv('STREAM_EVENT_TIME_IDS') == '1'
+        
+        # Drop entries older than this many days with XTRIM MINID ~; 0 disables it
+        retention_ms = int(os.getenv('STREAM_RETENTION_DAYS', '0')) * 86_400_000
+        
+        # Number of ingest processes; 0 means one per CPU
+        workers = int(os.getenv('STREAM_WORKERS', '1')) or os.cpu_count() or 1
+        
         # Process CSV file
-        with open(csv_file, encoding='utf-8-sig') as csvf:
-            csv_reader = csv.DictReader(csvf)
-            total_processed = 0
+        if workers > 1:
+            if event_time_ids:
+                print("⚠️ STREAM_EVENT_TIME_IDS is ignored with STREAM_WORKERS > 1: parallel chunks cannot keep IDs increasing", file=sys.stderr)
+            total_processed = stream_in_parallel(csv_file, stream_name, workers, stream_maxlen)
             
-            for row in csv_reader:
-                try:
-                    # Convert all values to strings as Redis Streams require string values
-                    processed_row = {k: str(v) if v is not None else '' 
-                                   for k, v in row.items()}
-                    
-                    # Add to Redis stream
-                    redis_client.xadd(stream_name, processed_row)
-                    total_processed += 1
-                    
-                    # Print progress every 1000 records
-                    if total_processed % 1000 == 0:
-                        print(f"Processed {total_processed} records...")
-                        
-                except Exception as e:
-                    print(f"⚠️ Error processing row {total_processed + 1}: {e}", file=sys.stderr)
-                    continue
+            # Workers interleave entries, so trim once at the end against the wall clock
+            if retention_ms:
+                redis_client.xtrim(stream_name, minid=int(time.time() * 1000) - retention_ms, approximate=True)
+        else:
+            total_processed = stream_with_reader_thread(
+                redis_client, csv_file, stream_name, stream_maxlen, event_time_ids, retention_ms
+            )
         
         print(f"✅ Successfully processed {total_processed} records to Redis stream: {stream_name}")
         
@@ -96,6 +512,7 @@ def stream_orders(csv_file: str, stream_name: str) -> None:
     finally:
         if redis_client:
             redis_client.close()
+            redis_client.connection_pool.disconnect()
 
 
 if __name__ == "__main__":
@@ -1,48 +1,58 @@
+import asyncio
 import os
+import socket
 import sys
-import time
 import json
-from datetime import datetime
-from typing import Dict, Any, Optional
-from dotenv import load_dotenv
+from datetime import date
+from typing import Dict, List, Optional, Tuple
 import redis
+from redis import asyncio as aioredis
 from pydantic import ValidationError
+# _config loads .env, so import it before Schema builds its redis-om connection
+from _config import make_async_pool
 from Schema import Product, Order  # Assuming Schema.py contains these classes
 
+# Maximum number of stream entries fetched per XREADGROUP call
+BATCH_SIZE = 500
 
-def create_redis_connection() -> redis.Redis:
+# Set VALIDATE=1 to build orders with full Pydantic validation (slower, for debugging)
+VALIDATE = os.getenv('VALIDATE') == '1'
+
+# Set VERBOSE=1 to log every order; otherwise only periodic progress is written to stderr
+VERBOSE = os.getenv('VERBOSE') == '1'
+PROGRESS_INTERVAL = 10_000
+
+# Set once the first unexpected processing error has been reported
+_reported_unexpected_error = False
+
+SEP = "-" * 50
+
+# Stream fields read by process_order, with their defaults, in unpacking order
+ORDER_FIELDS = (
+    (b'StockCode', b''),
+    (b'Description', b''),
+    (b'UnitPrice', b'0'),
+    (b'InvoiceNo', b''),
+    (b'Quantity', b'1'),
+    (b'InvoiceDate', b''),
+    (b'CustomerID', b''),
+    (b'Country', b''),
+)
+
+
+async def create_redis_connection() -> aioredis.Redis:
     """
-    Create and return a Redis connection using environment variables.
+    Create and return an asyncio Redis connection using the settings in _config.
     
     Returns:
-        redis.Redis: Redis client instance
+        redis.asyncio.Redis: Async Redis client instance
     """
     try:
-        # Load environment variables from .env file
-        load_dotenv()
-        
-        # Get Redis connection details from environment variables
-        redis_host = os.getenv('REDIS_HOST')
-        redis_port = int(os.getenv('REDIS_PORT', '19536'))
-        redis_username = os.getenv('REDIS_USERNAME', 'default')
-        redis_password = os.getenv('REDIS_PASSWORD')
-        
-        if not all([redis_host, redis_password]):
-            raise ValueError("Missing required Redis connection parameters in .env file")
-        
-        # Create Redis connection
-        redis_client = redis.Redis(
-            host=redis_host,
-            port=redis_port,
-            username=redis_username,
-            password=redis_password,
-            decode_responses=True,
-            socket_connect_timeout=5,
-            health_check_interval=30,
-        )
+        # Create Redis connection backed by a bounded pool of reusable connections
+        redis_client = aioredis.Redis(connection_pool=make_async_pool())
         
         # Test the connection
-        if not redis_client.ping():
+        if not await redis_client.ping():
             raise ConnectionError("Failed to ping Redis server")
             
         return redis_client
@@ -52,128 +62,366 @@ def create_redis_connection() -> redis.Redis:
         sys.exit(1)
 
 
-def process_order(order_data: Dict[str, Any]) -> Optional[Order]:
+def parse_invoice_date(invoice_date_str: str) -> date:
+    """
+    Parse the date part of an InvoiceDate string such as '12/1/2010 8:26'.
+    
+    Splitting by hand avoids the overhead of datetime.strptime for this fixed format.
+    
+    Args:
+        invoice_date_str: Invoice date in 'M/D/YYYY H:MM' format
+        
+    Returns:
+        date: The invoice date with the time discarded
+        
+    Raises:
+        ValueError: If the string is not in the expected format
+    """
+    month, day, year = invoice_date_str.split(' ', 1)[0].split('/')
+    return date(int(year), int(month), int(day))
+
+
+def process_order(entry_id: bytes, order_data: Dict[bytes, bytes]) -> Optional[Order]:
     """
     Process raw order data and return a validated Order object.
     
+    The order's primary key is its stream entry ID, so saving a redelivered
+    entry overwrites the document it already wrote instead of adding a copy.
+    
     Args:
-        order_data: Dictionary containing order data from Redis stream
+        entry_id: ID of the stream entry the order was read from
+        order_data: Dictionary containing raw (bytes) order data from Redis stream
         
     Returns:
-        Order: Validated Order object if successful, None otherwise
+        Order: Validated Order object if successful, None otherwise (the reason
+            for rejected data is printed only with VERBOSE=1)
     """
     try:
-        # Create Product instance
-        item = Product(
-            StockCode=order_data.get('StockCode', ''),
-            Description=order_data.get('Description', ''),
-            UnitPrice=order_data.get('UnitPrice', '0')
-        )
-
+        # One pass over the fixed schema with a locally bound lookup
+        get = order_data.get
+        (
+            stock_code, description, unit_price, invoice_no,
+            quantity, invoice_date_str, customer_id, country,
+        ) = [get(field, default).decode('utf-8') for field, default in ORDER_FIELDS]
+        
         # Correct for Pydantic date field
-        invoice_date_str = order_data.get('InvoiceDate', '')
         try:
-            invoice_dt = datetime.strptime(invoice_date_str, '%m/%d/%Y %H:%M')
-            invoice_date = invoice_dt.date()  # strips time
-        except (ValueError, TypeError):
-            print(f"⚠️ Invalid date format: {invoice_date_str}")
+            invoice_date = parse_invoice_date(invoice_date_str)
+        except ValueError:
+            if VERBOSE:
+                print(f"⚠️ Invalid date format: {invoice_date_str}")
             return None
-        # Pass invoice_date (type: date) to Order
-        return Order(
-            InvoiceNo=order_data.get('InvoiceNo', ''),
+        
+        pk = entry_id.decode('utf-8')
+        
+        if VALIDATE:
+            # Full Pydantic validation, useful when debugging bad input
+            return Order(
+                pk=pk,
+                InvoiceNo=invoice_no,
+                Item=Product(StockCode=stock_code, Description=description, UnitPrice=unit_price),
+                Quantity=quantity,
+                InvoiceDate=invoice_date,
+                CustomerID=customer_id,
+                Country=country
+            )
+        
+        # Coerce the typed fields by hand and skip construction-time validation.
+        # JsonModel.save() still runs check(), so full validation moves into
+        # save_orders rather than disappearing. The embedded Product keeps
+        # pk=None, exactly as Product(...) leaves it
+        item = Product.model_construct(
+            StockCode=stock_code,
+            Description=description,
+            UnitPrice=float(unit_price or 0)
+        )
+        return Order.model_construct(
+            pk=pk,
+            InvoiceNo=invoice_no,
             Item=item,
-            Quantity=order_data.get('Quantity', '1'),
+            Quantity=int(quantity),
             InvoiceDate=invoice_date,  # now just the date!
-            CustomerID=order_data.get('CustomerID', ''),
-            Country=order_data.get('Country', '')
+            CustomerID=int(customer_id),
+            Country=country
         )
 
-    except ValidationError as e:
-        print(f"⚠️ Validation error: {e}")
+    except (ValidationError, ValueError) as e:
+        if VERBOSE:
+            print(f"⚠️ Validation error: {e}")
         return None
     except Exception as e:
-        print(f"⚠️ Error processing order: {e}")
+        # Not a data problem but a bug or an environment issue, so never hide the first one
+        global _reported_unexpected_error
+        if VERBOSE or not _reported_unexpected_error:
+            _reported_unexpected_error = True
+            print(f"⚠️ Error processing order: {e!r}", file=sys.stderr)
+            if not VERBOSE:
+                print("   (further errors like this are only shown with VERBOSE=1)", file=sys.stderr)
         return None
 
 
-def subscribe_and_insert_orders(stream_name: str = 'orders', last_id: str = '$') -> None:
+async def create_consumer_group(redis_client: aioredis.Redis, stream_name: str, group_name: str, start_id: str = '$') -> None:
     """
-    Subscribe to a Redis stream and insert valid orders into the database.
+    Create the consumer group for the stream if it does not exist yet.
+    
+    Args:
+        redis_client: Async Redis client instance
+        stream_name: Name of the Redis stream
+        group_name: Name of the consumer group
+        start_id: ID the group starts reading after (default: '$' for new messages)
+    """
+    try:
+        await redis_client.xgroup_create(stream_name, group_name, id=start_id, mkstream=True)
+        print(f"✅ Created consumer group '{group_name}' on stream: {stream_name}")
+    except redis.exceptions.ResponseError as e:
+        # The group survives restarts; reuse it so we resume from its last delivered ID
+        if 'BUSYGROUP' not in str(e):
+            raise
+
+
+def save_orders(orders: List[Tuple[bytes, Order]]) -> Tuple[List[bytes], List[bytes]]:
+    """
+    Save a batch of orders to the database in a single pipelined round-trip.
+    
+    Each JsonModel save is one JSON.SET that RediSearch indexes server-side,
+    so queuing them all on one pipeline is what saves the round-trips. save()
+    runs check() before queuing, so an invalid order only drops itself.
+    
+    Args:
+        orders: (entry ID, order) pairs to save
+        
+    Returns:
+        Tuple[List[bytes], List[bytes]]: IDs of the entries whose order was saved, and of
+            those whose order failed validation. Entries in neither list failed for another
+            reason and should stay pending so they are retried
+        
+    Raises:
+        redis.exceptions.RedisError: If the pipeline could not be executed at all
+    """
+    saved_ids: List[bytes] = []
+    rejected_ids: List[bytes] = []
+    if not orders:
+        return saved_ids, rejected_ids
+    
+    pipe = Order.db().pipeline(transaction=False)
+    queued = []
+    for entry_id, order in orders:
+        try:
+            order.save(pipeline=pipe)
+        except ValidationError as e:
+            if VERBOSE:
+                print(f"⚠️ Validation error: {e}")
+            rejected_ids.append(entry_id)
+            continue
+        except Exception as e:
+            print(f"⚠️ Error saving order {order.key()}: {e}", file=sys.stderr)
+            continue
+        queued.append((entry_id, order))
+    
+    if not queued:
+        return saved_ids, rejected_ids
+    results = pipe.execute(raise_on_error=False)
+    
+    # One reply per queued save, in order; failed ones are left pending
+    failed = []
+    for (entry_id, order), result in zip(queued, results):
+        if isinstance(result, Exception):
+            failed.append(result)
+        else:
+            saved_ids.append(entry_id)
+            if VERBOSE:
+                sys.stdout.write(f"✅ Successfully saved order: {order.key()}\n")
+    if failed:
+        print(f"⚠️ Error saving {len(failed)} of {len(queued)} orders: {failed[0]}")
+    return saved_ids, rejected_ids
+
+
+async def finish_batch(
+    redis_client: aioredis.Redis,
+    stream_name: str,
+    group_name: str,
+    entries: List[Tuple[bytes, Optional[Order]]],
+) -> Tuple[int, int, bool]:
+    """
+    Save a batch's valid orders, then acknowledge the entries that are done with.
+    
+    redis-om's save is synchronous, so the pipelined save runs in a worker
+    thread and does not block the event loop. Only entries that were saved or
+    rejected as invalid are acknowledged; the rest stay in the pending list and
+    are read again. A failed XACK is reported rather than raised for the same reason.
+    
+    Args:
+        redis_client: Async Redis client instance
+        stream_name: Name of the Redis stream
+        group_name: Name of the consumer group
+        entries: (entry ID, order) pairs for every entry read in the batch, with
+            None for entries that could not be turned into an order
+        
+    Returns:
+        Tuple[int, int, bool]: Number of orders saved, number rejected by validation
+            at save time, and whether every entry in the batch was acknowledged
+    """
+    ack_ids = [entry_id for entry_id, order in entries if order is None]
+    try:
+        saved_ids, rejected_ids = await asyncio.to_thread(
+            save_orders, [(entry_id, order) for entry_id, order in entries if order is not None]
+        )
+    except Exception as e:
+        # Nothing was written, so leave the whole batch pending for a retry
+        print(f"⚠️ Error saving orders, leaving {len(entries)} entries pending: {e}", file=sys.stderr)
+        return 0, 0, False
+    ack_ids += saved_ids + rejected_ids
+    
+    # Acknowledge the finished entries in a single XACK
+    try:
+        if ack_ids:
+            await redis_client.xack(stream_name, group_name, *ack_ids)
+    except redis.exceptions.RedisError as e:
+        print(f"⚠️ Error acknowledging {len(ack_ids)} entries: {e}", file=sys.stderr)
+        return len(saved_ids), len(rejected_ids), False
+    return len(saved_ids), len(rejected_ids), len(ack_ids) == len(entries)
+
+
+async def subscribe_and_insert_orders(
+    stream_name: str = 'orders',
+    last_id: str = '$',
+    group_name: str = 'workers',
+    consumer_name: Optional[str] = None,
+) -> None:
+    """
+    Consume a Redis stream through a consumer group and insert valid orders into the database.
+    
+    Each batch is saved in one pipeline while the next one is read, and is
+    acknowledged once its save has completed.
     
     Args:
         stream_name: Name of the Redis stream to subscribe to
-        last_id: ID to start reading from (default: '$' for new messages)
+        last_id: ID the consumer group starts from when it is first created (default: '$' for new messages)
+        group_name: Name of the consumer group
+        consumer_name: Name of this consumer within the group (default: the hostname). Keep it
+            stable across restarts so the consumer picks up its own unacknowledged entries,
+            and unique per subscriber: consumers sharing a name share one pending list
     """
     redis_client = None
     processed_count = 0
+    skipped_count = 0
+    consumer_name = consumer_name or socket.gethostname()
+    pending_batch: Optional["asyncio.Task[Tuple[int, int, bool]]"] = None
+    
+    # Start from this consumer's pending list ('0'): entries delivered before a crash
+    # or connection error but never acknowledged. Switch to new entries ('>') once it is empty
+    read_id = '0'
     
     try:
-        redis_client = create_redis_connection()
-        print(f"✅ Successfully connected to Redis. Listening to stream: {stream_name}")
+        redis_client = await create_redis_connection()
+        await create_consumer_group(redis_client, stream_name, group_name, last_id)
+        print(f"✅ Successfully connected to Redis. Listening to stream: {stream_name} as {group_name}/{consumer_name}")
         print("Press Ctrl+C to exit...\n" + "="*50)
         
         while True:
             try:
-                # Read from the stream, blocking for up to 1 second
-                messages = redis_client.xread(
-                    {stream_name: last_id},
-                    count=1,
+                # The pending list includes the in-flight batch, so let it finish before re-reading it
+                if read_id == '0' and pending_batch is not None:
+                    batch, pending_batch = pending_batch, None
+                    saved, rejected, _ = await batch
+                    processed_count += saved
+                    skipped_count += rejected
+                
+                # Read a batch of entries for this consumer, blocking for up to 1 second
+                requested_id = read_id
+                messages = await redis_client.xreadgroup(
+                    group_name,
+                    consumer_name,
+                    {stream_name: requested_id},
+                    count=BATCH_SIZE,
                     block=1000  # 1 second timeout
                 )
                 
+                # Let the previous batch finish before starting the next one. finish_batch
+                # never raises, so the messages just read are always processed
+                if pending_batch is not None:
+                    batch, pending_batch = pending_batch, None
+                    previous_count = processed_count
+                    saved, rejected, acked = await batch
+                    processed_count += saved
+                    skipped_count += rejected
+                    if not acked:
+                        # Re-read the unacknowledged entries from the pending list next time
+                        read_id = '0'
+                    if VERBOSE:
+                        print(f"📊 Total orders processed: {processed_count} (skipped {skipped_count} invalid)")
+                    elif processed_count // PROGRESS_INTERVAL > previous_count // PROGRESS_INTERVAL:
+                        sys.stderr.write(f"📊 Total orders processed: {processed_count} (skipped {skipped_count} invalid)\n")
+                        sys.stderr.flush()
+                
+                if requested_id == '0' and not any(entries for _, entries in messages or []):
+                    # Pending list drained; from now on only read new entries
+                    read_id = '>'
+                    continue
+                
                 if not messages:
                     continue
-                    
+                
+                batch_entries = []
                 for stream in messages:
                     _, entries = stream
                     
                     for entry_id, order_data in entries:
-                        print(f"\n📦 Processing order: {entry_id}")
-                        print("-" * 50)
+                        if VERBOSE:
+                            sys.stdout.write(f"\n📦 Processing order: {entry_id.decode('utf-8')}\n{SEP}\n")
                         
-                        # Process and validate the order
-                        order = process_order(order_data)
+                        # Process and validate the order; the batch is saved in the background.
+                        # Pending entries trimmed from the stream come back without data
+                        order = process_order(entry_id, order_data) if order_data else None
                         
-                        if order:
-                            try:
-                                # Save the order to the database
-                                order_key = order.key()
-                                order.save()
-                                processed_count += 1
-                                print(f"✅ Successfully saved order: {order_key}")
-                                print(f"📊 Total orders processed: {processed_count}")
-                            except Exception as e:
-                                print(f"⚠️ Error saving order: {e}")
+                        if not order:
+                            skipped_count += 1
                         
-                        # Update the last ID to avoid reprocessing the same messages
-                        last_id = entry_id
+                        batch_entries.append((entry_id, order))
+                
+                pending_batch = asyncio.create_task(
+                    finish_batch(redis_client, stream_name, group_name, batch_entries)
+                )
                         
             except redis.exceptions.ConnectionError as e:
                 print(f"⚠️ Redis connection error: {e}. Reconnecting...")
-                time.sleep(5)  # Wait before reconnecting
-                redis_client = create_redis_connection()
-                
-            except KeyboardInterrupt:
-                print("\n👋 Exiting...")
-                break
+                # The pool drops the broken connection and opens a fresh one on the next command
+                await asyncio.sleep(5)  # Wait before reconnecting
+                # Entries delivered around the failure may be unacknowledged; pick them up again
+                read_id = '0'
                 
             except Exception as e:
                 print(f"⚠️ Error processing message: {e}", file=sys.stderr)
-                time.sleep(1)  # Prevent tight loop on errors
+                await asyncio.sleep(1)  # Prevent tight loop on errors
                 
     except Exception as e:
         print(f"❌ Fatal error: {e}", file=sys.stderr)
         
     finally:
+        # Finish the in-flight batch so its XACK is sent and its orders are counted
+        if pending_batch is not None:
+            try:
+                saved, rejected, _ = await pending_batch
+                processed_count += saved
+                skipped_count += rejected
+            except (asyncio.CancelledError, Exception) as e:
+                print(f"⚠️ Could not finish the last batch: {e!r}", file=sys.stderr)
+        
         if redis_client:
-            redis_client.close()
-        print(f"\n📊 Total orders processed in this session: {processed_count}")
+            await redis_client.close()
+            await redis_client.connection_pool.disconnect()
+        print(f"\n📊 Total orders processed in this session: {processed_count} (skipped {skipped_count} invalid)")
 
 
 if __name__ == "__main__":
 
     # Configuration
     STREAM_NAME = "orders"
+    # Set CONSUMER_NAME to run more than one subscriber on the same host
+    CONSUMER_NAME = os.getenv('CONSUMER_NAME')
     
     # Start the subscriber and order processor
-    subscribe_and_insert_orders(STREAM_NAME)
+    try:
+        asyncio.run(subscribe_and_insert_orders(STREAM_NAME, consumer_name=CONSUMER_NAME))
+    except KeyboardInterrupt:
+        print("\n👋 Exiting...")
@@ -1,43 +1,24 @@
-import os
 import sys
 import time
-import json
 from datetime import datetime
 from typing import Dict, Any, Optional
-from dotenv import load_dotenv
+import orjson
 import redis
+from _config import make_pool
+
+SEP = "-" * 50
 
 
 def create_redis_connection() -> redis.Redis:
     """
-    Create and return a Redis connection using environment variables.
+    Create and return a Redis connection using the settings in _config.
     
     Returns:
         redis.Redis: Redis client instance
     """
     try:
-        # Load environment variables from .env file
-        load_dotenv()
-        
-        # Get Redis connection details from environment variables
-        redis_host = os.getenv('REDIS_HOST')
-        redis_port = int(os.getenv('REDIS_PORT', '19536'))
-        redis_username = os.getenv('REDIS_USERNAME', 'default')
-        redis_password = os.getenv('REDIS_PASSWORD')
-        
-        if not all([redis_host, redis_password]):
-            raise ValueError("Missing required Redis connection parameters in .env file")
-        
-        # Create Redis connection
-        redis_client = redis.Redis(
-            host=redis_host,
-            port=redis_port,
-            username=redis_username,
-            password=redis_password,
-            decode_responses=True,
-            socket_connect_timeout=5,
-            health_check_interval=30,
-        )
+        # Create Redis connection backed by a bounded pool of reusable connections
+        redis_client = redis.Redis(connection_pool=make_pool())
         
         # Test the connection
         if not redis_client.ping():
@@ -50,18 +31,21 @@ def create_redis_connection() -> redis.Redis:
         sys.exit(1)
 
 
-def format_order(order_data: Dict[str, str]) -> str:
-    """Format order data into a human-readable string."""
+def format_order(order_data: Dict[bytes, bytes]) -> str:
+    """Format raw (bytes) order data into a human-readable string."""
     try:
-        # Try to parse any JSON strings in the values
         formatted = {}
         for k, v in order_data.items():
-            try:
-                formatted[k] = json.loads(v) if v.startswith('{') and v.endswith('}') else v
-            except (json.JSONDecodeError, AttributeError):
-                formatted[k] = v
+            # Only values that look like JSON objects are worth trying to parse
+            if v[:1] == b'{':
+                try:
+                    formatted[k.decode('utf-8')] = orjson.loads(v)
+                    continue
+                except orjson.JSONDecodeError:
+                    pass
+            formatted[k.decode('utf-8')] = v.decode('utf-8')
                 
-        return json.dumps(formatted, indent=2)
+        return orjson.dumps(formatted, option=orjson.OPT_INDENT_2).decode('utf-8')
     except Exception as e:
         print(f"⚠️ Error formatting order: {e}")
         return str(order_data)
@@ -95,23 +79,22 @@ def subscribe_to_orders(stream_name: str = 'orders', last_id: str = '$') -> None
                     
                 for stream in messages:
                     stream_name, entries = stream
-                    print(f"\n📦 New order(s) in stream: {stream_name}")
-                    print("-" * 50)
+                    sys.stdout.write(f"\n📦 New order(s) in stream: {stream_name.decode('utf-8')}\n{SEP}\n")
                     
                     for entry_id, order_data in entries:
-                        print(f"🆔 Entry ID: {entry_id}")
-                        print(f"📅 Timestamp: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
-                        print("📝 Order Details:")
-                        print(format_order(order_data))
-                        print("-" * 50)
+                        sys.stdout.write(
+                            f"🆔 Entry ID: {entry_id.decode('utf-8')}\n"
+                            f"📅 Timestamp: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n"
+                            f"📝 Order Details:\n{format_order(order_data)}\n{SEP}\n"
+                        )
                         
                         # Update the last ID to avoid reprocessing the same messages
                         last_id = entry_id
                         
             except redis.exceptions.ConnectionError as e:
                 print(f"⚠️ Redis connection error: {e}. Reconnecting...")
+                # The pool drops the broken connection and opens a fresh one on the next command
                 time.sleep(5)  # Wait before reconnecting
-                redis_client = create_redis_connection()
                 
             except KeyboardInterrupt:
                 print("\n👋 Exiting...")
@@ -127,6 +110,7 @@ def subscribe_to_orders(stream_name: str = 'orders', last_id: str = '$') -> None
     finally:
         if redis_client:
             redis_client.close()
+            redis_client.connection_pool.disconnect()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,103 @@
+"""
+Redis connection settings shared by the scripts.
+
+The .env file is loaded once, at import time, and every setting is read into a
+module-level constant so reconnecting never goes back to the file system.
+"""
+import os
+import socket
+import redis
+from redis import asyncio as aioredis
+from dotenv import load_dotenv
+
+# Load environment variables from .env file
+load_dotenv()
+
+# Redis connection details
+REDIS_HOST = os.getenv('REDIS_HOST')
+REDIS_PORT = int(os.getenv('REDIS_PORT', '19536'))
+REDIS_USERNAME = os.getenv('REDIS_USERNAME', 'default')
+REDIS_PASSWORD = os.getenv('REDIS_PASSWORD')
+REDIS_DB = int(os.getenv('REDIS_DB', '0'))
+
+# Optional UNIX domain socket path, preferred over TCP when Redis is local
+REDIS_UNIX_SOCKET = os.getenv('REDIS_UNIX_SOCKET')
+
+# Size of the Redis connection pool; callers block when every connection is busy
+MAX_CONNECTIONS = 16
+
+# TCP keepalive: probe after 30 s idle, every 10 s, give up after 3 misses (where the platform supports it)
+TCP_KEEPALIVE_OPTIONS = {
+    option: value
+    for option, value in (
+        (getattr(socket, 'TCP_KEEPIDLE', None), 30),
+        (getattr(socket, 'TCP_KEEPINTVL', None), 10),
+        (getattr(socket, 'TCP_KEEPCNT', None), 3),
+    )
+    if option is not None
+}
+
+# Where to connect: the UNIX socket if configured, otherwise TCP with keepalive
+if REDIS_UNIX_SOCKET:
+    REDIS_ENDPOINT = {'path': REDIS_UNIX_SOCKET}
+else:
+    REDIS_ENDPOINT = {
+        'host': REDIS_HOST,
+        'port': REDIS_PORT,
+        'socket_keepalive': True,
+        'socket_keepalive_options': TCP_KEEPALIVE_OPTIONS,
+    }
+
+
+def _make_pool(client, health_check_interval: int, decode_responses: bool):
+    """Build a BlockingConnectionPool from the client module's own classes."""
+    if not all([REDIS_HOST or REDIS_UNIX_SOCKET, REDIS_PASSWORD]):
+        raise ValueError("Missing required Redis connection parameters in .env file")
+    
+    # The hiredis parser is used automatically when installed
+    return client.BlockingConnectionPool(
+        max_connections=MAX_CONNECTIONS,
+        connection_class=client.UnixDomainSocketConnection if REDIS_UNIX_SOCKET else client.Connection,
+        username=REDIS_USERNAME,
+        password=REDIS_PASSWORD,
+        db=REDIS_DB,
+        decode_responses=decode_responses,
+        socket_connect_timeout=5,
+        health_check_interval=health_check_interval,
+        **REDIS_ENDPOINT,
+    )
+
+
+def make_pool(health_check_interval: int = 30, decode_responses: bool = False) -> redis.BlockingConnectionPool:
+    """
+    Create a bounded pool of reusable Redis connections using the settings above.
+    
+    Args:
+        health_check_interval: Seconds between connection health checks; 0 disables them
+        decode_responses: Decode replies to str; by default they stay bytes so
+            callers decode only what they use
+        
+    Returns:
+        redis.BlockingConnectionPool: Connection pool for redis.Redis
+        
+    Raises:
+        ValueError: If the host (or UNIX socket) or password is not configured
+    """
+    return _make_pool(redis, health_check_interval, decode_responses)
+
+
+def make_async_pool(health_check_interval: int = 30, decode_responses: bool = False) -> aioredis.BlockingConnectionPool:
+    """
+    Create the redis.asyncio equivalent of make_pool.
+    
+    Args:
+        health_check_interval: Seconds between connection health checks; 0 disables them
+        decode_responses: Decode replies to str; by default they stay bytes
+        
+    Returns:
+        redis.asyncio.BlockingConnectionPool: Connection pool for redis.asyncio.Redis
+        
+    Raises:
+        ValueError: If the host (or UNIX socket) or password is not configured
+    """
+    return _make_pool(aioredis, health_check_interval, decode_responses)
@@ -1,41 +1,19 @@
 import redis
-import os
-from dotenv import load_dotenv
 from typing import Optional
+from _config import make_pool
 
 
 def create_redis_connection() -> redis.Redis:
     """
-    Create and return a Redis connection using environment variables.
+    Create and return a Redis connection using the settings in _config.
     
     Returns:
         redis.Redis: Redis client instance
     """
     try:
-        # Load environment variables from .env file if it exists
-        load_dotenv()
-        
-        # Get Redis connection details from environment variables
-        redis_host = os.getenv('REDIS_HOST')
-        redis_port = int(os.getenv('REDIS_PORT', '19536'))
-        redis_username = os.getenv('REDIS_USERNAME', 'default')
-        redis_password = os.getenv('REDIS_PASSWORD')
-        redis_db = int(os.getenv('REDIS_DB', '0'))
-        
-        if not all([redis_host, redis_password]):
-            raise ValueError("Missing required Redis connection parameters in environment variables")
-        
-        # Create Redis connection
-        redis_client = redis.Redis(
-            host=redis_host,
-            port=redis_port,
-            username=redis_username,
-            password=redis_password,
-            db=redis_db,
-            decode_responses=True,
-            socket_connect_timeout=5,  # 5 seconds timeout
-            health_check_interval=30,   # Check connection health every 30 seconds
-        )
+        # Create Redis connection backed by a bounded pool of reusable connections,
+        # decoding replies since this script prints them as text
+        redis_client = redis.Redis(connection_pool=make_pool(decode_responses=True))
         
         # Test the connection
         if not redis_client.ping():